@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Batch runner for stormwater toolkit calculations
+Reads a JSON-lines stream of calculation jobs and writes one JSON-lines result per job, in input order
+
+Job:     {"id": "site-12", "function": "calculate_runoff_volume_scs",
+          "args": {"area_acres": 10, "rainfall_depth_inches": 2.5, "curve_number": 80}}
+         ("args" may also be a list of positional arguments)
+Result:  {"id": "site-12", "line": 1, "function": "...", "ok": true, "result": {...}}
+         {"id": "site-13", "line": 2, "function": "...", "ok": false, "error": "ZeroDivisionError: ..."}
+
+Usage:
+    python batch_runner.py jobs.jsonl -o results.jsonl --workers 4
+    python batch_runner.py jobs.jsonl -o results.jsonl --resume
+"""
+
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import stormwater_toolkit
+
+TOOLKIT_FUNCTIONS = {name: getattr(stormwater_toolkit, name) for name in stormwater_toolkit.__all__}
+SIGNATURES = {name: inspect.signature(func) for name, func in TOOLKIT_FUNCTIONS.items()}
+PARAMETERS = {name: [(p.name, p.default) for p in sig.parameters.values()] for name, sig in SIGNATURES.items()}
+
+def _error_text(exc):
+    return f"{type(exc).__name__}: {exc}"
+
+def _bind_job(job):
+    """Resolve a parsed job to its function name and bound arguments (defaults applied)"""
+    if not isinstance(job, dict):
+        raise ValueError("Job must be a JSON object")
+    name = job.get('function')
+    if name not in TOOLKIT_FUNCTIONS:
+        raise ValueError(f"Unknown toolkit function: {name!r}")
+
+    args = job.get('args', {})
+    if not isinstance(args, (dict, list)):
+        raise ValueError("'args' must be an object or a list")
+
+    # Fast path for well-formed jobs; Signature.bind dominates chunk time otherwise
+    params = PARAMETERS[name]
+    keyword_args = dict(zip((param for param, _ in params), args)) if isinstance(args, list) else args
+    if isinstance(args, dict) or len(args) <= len(params):
+        arguments = {param: keyword_args.get(param, default) for param, default in params}
+        if keyword_args.keys() <= arguments.keys() and inspect.Parameter.empty not in arguments.values():
+            return name, arguments
+
+    # Malformed jobs: let Signature.bind raise the same TypeError a direct call would
+    bound = SIGNATURES[name].bind(**args) if isinstance(args, dict) else SIGNATURES[name].bind(*args)
+    bound.apply_defaults()
+    return name, bound.arguments
+
+def run_chunk(chunk):
+    """Process a chunk of (line_number, raw_line) pairs; returns (serialized results, error count)"""
+    lines = []
+    errors = 0
+    for line_number, raw in chunk:
+        record = {'id': None, 'line': line_number, 'function': None}
+        try:
+            job = json.loads(raw)
+            if isinstance(job, dict):
+                record['id'] = job.get('id')
+                record['function'] = job.get('function')
+            name, arguments = _bind_job(job)
+            record['ok'] = True
+            record['result'] = TOOLKIT_FUNCTIONS[name](**arguments)
+        except Exception as e:
+            record['ok'] = False
+            record['error'] = _error_text(e)
+            errors += 1
+        lines.append(json.dumps(record, default=str))
+    return lines, errors
+
+def _read_chunks(stream, batch_size, skip_lines):
+    """Yield (lines consumed, [(line_number, raw_line), ...]) chunks, skipping blank lines"""
+    line_number = skip_lines
+    for _ in islice(stream, skip_lines):
+        pass
+    while True:
+        raw_lines = list(islice(stream, batch_size))
+        if not raw_lines:
+            return
+        chunk = []
+        for raw in raw_lines:
+            line_number += 1
+            if raw.strip():
+                chunk.append((line_number, raw))
+        yield len(raw_lines), chunk
+
+def _load_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _save_checkpoint(path, state):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+def run_batch(input_path, output_path, workers=None, batch_size=5000, resume=False, progress_interval_s=2.0):
+    """Run every job in input_path and stream ordered results to output_path"""
+    checkpoint_path = None if output_path == '-' else output_path + '.checkpoint'
+    state = {'input': os.path.abspath(input_path), 'lines_done': 0, 'jobs_done': 0, 'errors': 0, 'output_bytes': 0}
+
+    if resume and checkpoint_path:
+        saved = _load_checkpoint(checkpoint_path)
+        if saved and saved.get('input') == state['input']:
+            state = saved
+            print(f"Resuming after line {state['lines_done']} ({state['jobs_done']} jobs already written)",
+                  file=sys.stderr)
+
+    source = sys.stdin if input_path == '-' else open(input_path, 'r')
+    if output_path == '-':
+        sink = sys.stdout
+    else:
+        sink = open(output_path, 'a' if state['output_bytes'] else 'w')
+        # Drop anything written after the last checkpoint so no result is duplicated
+        sink.truncate(state['output_bytes'])
+        sink.seek(state['output_bytes'])
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+    started = time.perf_counter()
+    last_report = started
+    jobs_this_run = 0
+
+    def drain_one():
+        nonlocal jobs_this_run, last_report
+        lines_consumed, future_or_result = pending.popleft()
+        lines, errors = future_or_result.result() if executor else future_or_result
+        if lines:
+            sink.write('\n'.join(lines) + '\n')
+        sink.flush()
+
+        jobs_this_run += len(lines)
+        state['lines_done'] += lines_consumed
+        state['jobs_done'] += len(lines)
+        state['errors'] += errors
+        if checkpoint_path:
+            state['output_bytes'] = sink.tell()
+            _save_checkpoint(checkpoint_path, state)
+
+        now = time.perf_counter()
+        if now - last_report >= progress_interval_s:
+            rate = jobs_this_run / (now - started)
+            print(f"[batch] {state['jobs_done']} jobs, {state['errors']} errors, {rate:,.0f} jobs/s",
+                  file=sys.stderr)
+            last_report = now
+
+    try:
+        for lines_consumed, chunk in _read_chunks(source, batch_size, state['lines_done']):
+            if executor:
+                pending.append((lines_consumed, executor.submit(run_chunk, chunk)))
+                # Bound the number of chunks in flight so memory stays flat on long inputs
+                while len(pending) >= workers * 2:
+                    drain_one()
+            else:
+                pending.append((lines_consumed, run_chunk(chunk)))
+                drain_one()
+        while pending:
+            drain_one()
+    except KeyboardInterrupt:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = None
+        where = "; rerun with --resume to continue" if checkpoint_path else ""
+        print(f"Interrupted after {state['jobs_done']} jobs{where}", file=sys.stderr)
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    elapsed = time.perf_counter() - started
+    rate = jobs_this_run / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {state['jobs_done']} jobs ({state['errors']} errors) in {elapsed:.2f}s, {rate:,.0f} jobs/s",
+          file=sys.stderr)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return state
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Run stormwater toolkit calculations from a JSON-lines job file")
+    parser.add_argument('input', help="JSON-lines job file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="JSON-lines result file, or - for stdout (default)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('-b', '--batch-size', type=int, default=5000, help="Jobs per worker chunk")
+    parser.add_argument('--resume', action='store_true', help="Continue from the output file's checkpoint")
+    args = parser.parse_args()
+
+    if args.resume and args.output == '-':
+        parser.error("--resume needs an output file")
+
+    try:
+        run_batch(args.input, args.output, args.workers, args.batch_size, args.resume)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Benchmark and scaling suite for the stormwater toolkit
+Times every toolkit function at increasing input sizes, measures the cold-start cost of the
+analysis preamble, records throughput and peak memory to a results file and flags regressions
+against a stored baseline
+
+Per-site functions are measured as N separate calls; aggregate functions
+(analyze_runoff_coefficient, water_quality_analysis) as one call over N records.
+
+Usage:
+    python benchmark_toolkit.py -o bench_results.json --save-baseline benchmarks_baseline.json
+    python benchmark_toolkit.py -o bench_results.json --baseline benchmarks_baseline.json
+    python benchmark_toolkit.py --sizes 1,1000 --functions calculate_runoff_volume_scs --no-memory
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import stormwater_toolkit
+
+DEFAULT_SIZES = [1, 1000, 100000, 1000000]
+# Each timing loops the workload until it lasts at least this long (as timeit's autorange does)
+MIN_TIMING_S = 0.2
+MIN_REPEATS = 5
+COLD_START_RUNS = 5
+DEFAULT_TOLERANCE = 0.25
+# Peak-memory growth below this is ignored; small cases measure only a few kilobytes
+MEMORY_FLOOR_MB = 1.0
+
+# The analysis script template PythonInterpreter renders for every /api/python/execute run
+PREAMBLE_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_preamble.py.tmpl')
+
+LAND_USES = ['residential', 'commercial', 'industrial', 'forest', 'agriculture', 'paved_parking', 'gravel', 'park']
+BMP_TYPES = ['bioretention', 'wet_pond', 'constructed_wetland', 'dry_detention', 'sand_filter']
+LAND_COVERS = ['paved', 'smooth', 'mixed', 'rough', 'very_rough']
+STORM_FREQUENCIES = ['2-year', '10-year', '25-year', '100-year']
+LOCATIONS = ['california_central', 'california_southern', 'california_northern']
+WQ_PARAMETERS = ['TSS', 'TP', 'TN', 'BOD', 'Metals', 'pH']
+
+def _cycle(values, n):
+    return [values[i % len(values)] for i in range(n)]
+
+# Column-wise inputs for the per-site functions (plain Python values, as callers pass them)
+COLUMN_BUILDERS = {
+    'runoff_volume_scs': lambda rng, n: {
+        'area_acres': rng.uniform(0.5, 200, n).tolist(),
+        'rainfall_depth_inches': rng.uniform(0.1, 6, n).tolist(),
+        'curve_number': rng.integers(40, 99, n).tolist()
+    },
+    'peak_flow_rational': lambda rng, n: {
+        'rainfall_intensity_in_hr': rng.uniform(0.2, 5, n).tolist(),
+        'area_acres': rng.uniform(0.5, 200, n).tolist(),
+        'runoff_coefficient': rng.uniform(0.1, 0.95, n).tolist(),
+        'storm_duration_min': rng.integers(1, 120, n).tolist()
+    },
+    'bmp_sizing': lambda rng, n: {
+        'drainage_area_acres': rng.uniform(0.5, 200, n).tolist(),
+        'runoff_depth_inches': rng.uniform(0.1, 3, n).tolist(),
+        'bmp_type': _cycle(BMP_TYPES, n),
+        'storm_frequency': _cycle(STORM_FREQUENCIES, n)
+    },
+    'culvert': lambda rng, n: {
+        'diameter_inches': rng.choice([12, 18, 24, 36, 48, 60], n).tolist(),
+        'length_ft': rng.uniform(20, 300, n).tolist(),
+        'inlet_elevation_ft': rng.uniform(100, 110, n).tolist(),
+        'outlet_elevation_ft': rng.uniform(90, 99, n).tolist(),
+        'headwater_depth_ft': rng.uniform(0.5, 8, n).tolist()
+    },
+    'time_of_concentration': lambda rng, n: {
+        'length_ft': rng.uniform(100, 10000, n).tolist(),
+        'slope_percent': rng.uniform(0.2, 15, n).tolist(),
+        'land_cover': _cycle(LAND_COVERS, n)
+    },
+    'manning': lambda rng, n: {
+        'cross_sectional_area_sf': rng.uniform(1, 100, n).tolist(),
+        'wetted_perimeter_ft': rng.uniform(3, 60, n).tolist(),
+        'slope_percent': rng.uniform(0.1, 5, n).tolist(),
+        'manning_n': rng.uniform(0.010, 0.075, n).tolist()
+    },
+    'idf': lambda rng, n: {
+        'storm_frequency': _cycle(STORM_FREQUENCIES, n),
+        'duration_minutes': rng.integers(5, 1440, n).tolist(),
+        'location': _cycle(LOCATIONS, n)
+    },
+    'regulatory_limit': lambda rng, n: {
+        'parameter': _cycle(WQ_PARAMETERS + ['Unknown'], n)
+    }
+}
+
+# function name -> (column set, aggregate builder); exactly one of the two is used
+CASES = {
+    'analyze_runoff_coefficient': (None, lambda rng, n: (
+        {f"{LAND_USES[i % len(LAND_USES)]}_{i}": float(area) for i, area in enumerate(rng.uniform(0.1, 50, n))},)),
+    'calculate_peak_flow_rational': ('peak_flow_rational', None),
+    'calculate_runoff_volume_scs': ('runoff_volume_scs', None),
+    'bmp_sizing_calculator': ('bmp_sizing', None),
+    'calculate_time_of_concentration': ('time_of_concentration', None),
+    'calculate_manning_flow': ('manning', None),
+    'calculate_idf_rainfall': ('idf', None),
+    'calculate_culvert_capacity': ('culvert', None),
+    'water_quality_analysis': (None, lambda rng, n: (
+        [{param: float(value) for param, value in zip(WQ_PARAMETERS, row)} for row in rng.gamma(2, 20, (n, 6))],)),
+    'get_regulatory_limit': ('regulatory_limit', None),
+}
+
+def _time_loops(run, loops):
+    started = time.perf_counter()
+    for _ in range(loops):
+        run()
+    return time.perf_counter() - started
+
+def _measure(run):
+    """Best per-run time over MIN_REPEATS timings, each looping run() for at least MIN_TIMING_S
+
+    Returns (seconds per run, repeats, loops per timing).
+    """
+    loops = 1
+    while True:
+        elapsed = _time_loops(run, loops)
+        if elapsed >= MIN_TIMING_S:
+            break
+        # Scale straight to the target, with headroom, rather than doubling step by step
+        loops = max(loops * 2, int(loops * MIN_TIMING_S * 1.2 / max(elapsed, 1e-9)))
+    timings = [elapsed / loops]
+    while len(timings) < MIN_REPEATS:
+        timings.append(_time_loops(run, loops) / loops)
+    return min(timings), len(timings), loops
+
+def _peak_memory_mb(run):
+    tracemalloc.start()
+    try:
+        run()
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+    finally:
+        tracemalloc.stop()
+
+def _workloads(name, size, rng):
+    """Yield (mode, callable) pairs to benchmark for one function at one size"""
+    func = getattr(stormwater_toolkit, name)
+    column_set, build_aggregate = CASES[name]
+
+    if build_aggregate is not None:
+        args = build_aggregate(rng, size)
+        yield 'aggregate', lambda: func(*args)
+        return
+
+    columns = COLUMN_BUILDERS[column_set](rng, size)
+    calls = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def run_scalar():
+        for kwargs in calls:
+            func(**kwargs)
+    yield 'scalar', run_scalar
+
+def benchmark_functions(sizes, functions, measure_memory=True, seed=0):
+    results = []
+    for name in functions:
+        for size in sizes:
+            rng = np.random.default_rng(seed)
+            for mode, run in _workloads(name, size, rng):
+                seconds, repeats, loops = _measure(run)
+                result = {
+                    'function': name,
+                    'mode': mode,
+                    'size': size,
+                    'seconds': round(seconds, 6),
+                    'repeats': repeats,
+                    'loops': loops,
+                    'throughput_per_s': round(size / seconds, 1) if seconds > 0 else None,
+                    'peak_memory_mb': _peak_memory_mb(run) if measure_memory else None
+                }
+                results.append(result)
+                _print_result(result)
+    return results
+
+def render_analysis_script(work_dir, user_code='pass', analysis_type='data_analysis'):
+    """Fill in the analysis script template the way PythonInterpreter.prepareStormwaterEnvironment does"""
+    with open(PREAMBLE_TEMPLATE, 'r') as f:
+        template = f.read()
+    values = {
+        'PROFILE_ENABLED': 'False',
+        'PROFILE_PATH': '',
+        'DATA_PATH': os.path.join(work_dir, 'data.json'),
+        'OUTPUT_PATH': os.path.join(work_dir, 'output.json'),
+        'ANALYSIS_TYPE': analysis_type,
+        'TEMP_DIR': work_dir,
+        'MODEL_DIR': os.path.join(work_dir, 'models'),
+        'IDF_PARAMETERS_PATH': os.path.join(work_dir, 'idf_parameters.json'),
+        'USER_CODE': '\n'.join('    ' + line for line in user_code.split('\n'))
+    }
+    return re.sub(r'\{\{([A-Z_]+)\}\}', lambda match: values.get(match.group(1), match.group(0)), template)
+
+def benchmark_cold_start(runs=COLD_START_RUNS):
+    """Run the full analysis script with empty user code in fresh interpreters, as each request does"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    process_times, import_times, script_times, memory = [], [], [], []
+    with tempfile.TemporaryDirectory() as work_dir:
+        script_path = os.path.join(work_dir, 'script.py')
+        with open(script_path, 'w') as f:
+            f.write(render_analysis_script(work_dir))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([work_dir, root]))
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, script_path], cwd=work_dir, env=env, capture_output=True, check=True)
+            process_times.append(time.perf_counter() - started)
+            with open(os.path.join(work_dir, 'output.json'), 'r') as f:
+                metrics = json.load(f)['metrics']
+            import_times.append(metrics['import_s'])
+            script_times.append(metrics['total_s'])
+            memory.append(metrics['peak_memory_mb'])
+
+    seconds = statistics.median(process_times)
+    result = {
+        'function': 'preamble_cold_start',
+        'mode': 'process',
+        'size': 1,
+        'seconds': round(seconds, 4),
+        'repeats': runs,
+        'throughput_per_s': round(1 / seconds, 3),
+        # Process peak RSS reported by the script, unlike the tracemalloc figures above
+        'peak_memory_mb': statistics.median(memory) if None not in memory else None,
+        'import_seconds': round(statistics.median(import_times), 4),
+        'script_seconds': round(statistics.median(script_times), 4)
+    }
+    _print_result(result)
+    return result
+
+def _print_result(result):
+    memory = f"{result['peak_memory_mb']:10.2f}" if result['peak_memory_mb'] is not None else f"{'-':>10}"
+    throughput = result['throughput_per_s'] or 0
+    throughput_text = f"{throughput:,.0f}" if throughput >= 100 else f"{throughput:.2f}"
+    print(f"{result['function']:<32} {result['mode']:<9} {result['size']:>9} "
+          f"{result['seconds']:>11.6f}s {throughput_text:>15}/s {memory} MB")
+
+def _case_key(result):
+    return (result['function'], result['mode'], result['size'])
+
+def environment_differences(environment, baseline):
+    """Environment fields that differ from the baseline's, as {field: (baseline, current)}"""
+    before = baseline.get('environment', {})
+    return {key: (before.get(key), environment.get(key))
+            for key in sorted(set(environment) | set(before)) if before.get(key) != environment.get(key)}
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Cases whose throughput fell, or whose peak memory grew, by more than tolerance versus the baseline"""
+    baseline_by_case = {_case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = baseline_by_case.get(_case_key(result))
+        if not before:
+            continue
+        if before.get('throughput_per_s') and result.get('throughput_per_s'):
+            ratio = result['throughput_per_s'] / before['throughput_per_s']
+            if ratio < 1 - tolerance:
+                regressions.append({**result, 'metric': 'throughput_per_s',
+                                    'baseline': before['throughput_per_s'], 'ratio': round(ratio, 3)})
+        if before.get('peak_memory_mb') is not None and result.get('peak_memory_mb') is not None:
+            growth = result['peak_memory_mb'] - before['peak_memory_mb']
+            if growth > MEMORY_FLOOR_MB and growth > tolerance * before['peak_memory_mb']:
+                ratio = result['peak_memory_mb'] / before['peak_memory_mb'] if before['peak_memory_mb'] else None
+                regressions.append({**result, 'metric': 'peak_memory_mb',
+                                    'baseline': before['peak_memory_mb'],
+                                    'ratio': round(ratio, 3) if ratio is not None else None})
+    return regressions
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Benchmark the stormwater toolkit")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="Results JSON file")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="Comma-separated input sizes")
+    parser.add_argument('--functions', help="Comma-separated subset of toolkit functions")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak-memory pass")
+    parser.add_argument('--no-cold-start', action='store_true', help="Skip the preamble cold-start measurement")
+    parser.add_argument('--baseline', help="Baseline results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed throughput drop or peak-memory growth versus the baseline (fraction)")
+    parser.add_argument('--save-baseline', help="Also write these results as a new baseline file")
+    parser.add_argument('--ignore-environment', action='store_true',
+                        help="Compare against a baseline recorded in a different environment (with a warning)")
+    args = parser.parse_args()
+
+    functions = args.functions.split(',') if args.functions else list(CASES)
+    unknown = [name for name in functions if name not in CASES]
+    if unknown:
+        parser.error(f"Unknown toolkit functions: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'function':<32} {'mode':<9} {'size':>9} {'time':>12} {'throughput':>17} {'peak mem':>13}")
+    results = benchmark_functions(sizes, functions, measure_memory=not args.no_memory)
+    if not args.no_cold_start:
+        results.append(benchmark_cold_start())
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        report['baseline'] = args.baseline
+        differences = environment_differences(report['environment'], baseline)
+        if differences:
+            report['environment_differences'] = differences
+            print(f"\nEnvironment differs from {args.baseline}:")
+            for key, (before, current) in differences.items():
+                print(f"  {key}: {before} -> {current}")
+        if differences and not args.ignore_environment:
+            # Timings from another machine or library version say nothing about this code
+            exit_code = 2
+            print("Not comparing against the baseline; record a new one here or pass --ignore-environment")
+        else:
+            regressions = compare_to_baseline(results, baseline, args.tolerance)
+            report['regressions'] = regressions
+            if regressions:
+                exit_code = 1
+                print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of {args.baseline}:")
+                for regression in regressions:
+                    metric = regression['metric']
+                    unit = '/s' if metric == 'throughput_per_s' else ' MB'
+                    print(f"  {regression['function']} [{regression['mode']}, n={regression['size']}] {metric}: "
+                          f"{regression[metric]:,.2f}{unit} vs {regression['baseline']:,.2f}{unit} "
+                          f"({regression['ratio'] or float('inf'):.2f}x)")
+            else:
+                print(f"\nNo regressions against {args.baseline}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+IDF frequency analysis from gauge rainfall records
+Extracts annual-maximum series per duration, fits GEV or log-Pearson III distributions and
+fits i = a / (t + b)^c per return period, producing the parameter tables that
+stormwater_toolkit.calculate_idf_rainfall consumes (see load_idf_parameters)
+
+Input is a CSV of rainfall depths (inches per time step), either long:
+    gauge,timestamp,depth_in
+or wide, one column per gauge:
+    timestamp,GAUGE_A,GAUGE_B,...
+
+Usage:
+    python idf_fitting.py rainfall.csv -o uploads/idf_parameters.json --distribution gev --workers 4
+"""
+
+import argparse
+import calendar
+import json
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import gamma
+
+DEFAULT_DURATIONS_MIN = [5, 10, 15, 30, 60, 120, 180, 360, 720, 1440]
+DEFAULT_RETURN_PERIODS = [2, 5, 10, 25, 50, 100]
+MIN_YEARS = 10
+MIN_YEAR_COVERAGE = 0.8
+GAUGES_PER_BLOCK = 32
+
+# Candidate b values (minutes) for the i = a / (t + b)^c fit; for fixed b the fit is linear in log space
+B_GRID = np.arange(0.0, 60.05, 0.1)
+
+def read_rainfall(path):
+    """Load a long or wide rainfall CSV as a wide frame (timestamp index, one column per gauge)"""
+    frame = pd.read_csv(path)
+    if 'gauge' in frame.columns:
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        return frame.pivot_table(index='timestamp', columns='gauge', values='depth_in', aggfunc='sum')
+    timestamp_column = frame.columns[0]
+    frame[timestamp_column] = pd.to_datetime(frame[timestamp_column])
+    return frame.set_index(timestamp_column).sort_index()
+
+def base_step_minutes(index):
+    """Recording interval, taken as the most common spacing between timestamps"""
+    spacing = pd.Series(index[1:] - index[:-1])
+    return spacing.mode().iloc[0].total_seconds() / 60
+
+def annual_maxima(block, durations_min, step_min):
+    """Annual-maximum rainfall intensity (in/hr) per duration for a block of gauges
+
+    Returns {duration: DataFrame(year x gauge)}, with NaN for years below the coverage threshold.
+    """
+    full_index = pd.date_range(block.index[0], block.index[-1], freq=pd.Timedelta(minutes=step_min))
+    block = block.reindex(full_index)
+    years = full_index.year
+    # Coverage is against the whole calendar year, so a partial first or last year is not
+    # mistaken for a complete one
+    observed_steps = block.notna().groupby(years).sum()
+    steps_per_year = [(366 if calendar.isleap(year) else 365) * 1440 / step_min for year in observed_steps.index]
+    coverage = observed_steps.div(steps_per_year, axis=0)
+
+    # Rolling sums for every duration come from one cumulative sum over all gauges
+    cumulative = np.vstack([np.zeros((1, block.shape[1])), np.nancumsum(block.to_numpy(dtype=float), axis=0)])
+    maxima = {}
+    for duration in durations_min:
+        window = int(round(duration / step_min))
+        if window < 1 or abs(window * step_min - duration) > 1e-9 or window > len(full_index):
+            continue
+        totals = cumulative[window:] - cumulative[:-window]
+        yearly = pd.DataFrame(totals, columns=block.columns).groupby(years[window - 1:]).max()
+        yearly = yearly.where(coverage.loc[yearly.index] >= MIN_YEAR_COVERAGE)
+        maxima[duration] = yearly / (duration / 60)
+    return maxima
+
+def _block_maxima(args):
+    block, durations_min, step_min = args
+    return annual_maxima(block, durations_min, step_min)
+
+def _sorted_columns(samples):
+    """Sort each column ascending with NaNs last; returns (sorted values, valid count per column)"""
+    ordered = np.sort(samples, axis=0)
+    return ordered, np.sum(~np.isnan(samples), axis=0)
+
+def fit_gev_quantiles(samples, return_periods):
+    """GEV quantiles by L-moments (Hosking, 1990) for every column of a (years x series) array"""
+    ordered, n = _sorted_columns(samples)
+    rank = np.arange(ordered.shape[0])[:, None]
+    valid = rank < n
+    x = np.where(valid, ordered, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b0 = x.sum(axis=0) / n
+        b1 = (x * rank / (n - 1)).sum(axis=0) / n
+        b2 = (x * rank * (rank - 1) / ((n - 1) * (n - 2))).sum(axis=0) / n
+        l1, l2, l3 = b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+        t3 = l3 / l2
+        z = 2 / (3 + t3) - np.log(2) / np.log(3)
+        k = 7.8590 * z + 2.9554 * z ** 2
+        alpha = l2 * k / ((1 - 2 ** -k) * gamma(1 + k))
+        xi = l1 + alpha * (gamma(1 + k) - 1) / k
+
+    # scipy's genextreme shape c matches Hosking's k
+    probabilities = 1 - 1 / np.asarray(return_periods, dtype=float)[:, None]
+    quantiles = stats.genextreme.ppf(probabilities, k, loc=xi, scale=alpha)
+    quantiles[:, n < MIN_YEARS] = np.nan
+    return quantiles
+
+def fit_lp3_quantiles(samples, return_periods):
+    """Log-Pearson III quantiles by moments of log10 values (Bulletin 17 style) per column"""
+    logs = np.log10(np.where(samples > 0, samples, np.nan))
+    n = np.sum(~np.isnan(logs), axis=0)
+    # Empty series only yield NaN here; they are masked out below
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(logs, axis=0)
+        std = np.nanstd(logs, axis=0, ddof=1)
+        skew = n / ((n - 1) * (n - 2)) * np.nansum(((logs - mean) / std) ** 3, axis=0)
+
+    probabilities = 1 - 1 / np.asarray(return_periods, dtype=float)[:, None]
+    frequency_factor = stats.pearson3.ppf(probabilities, skew)
+    quantiles = 10 ** (mean + frequency_factor * std)
+    quantiles[:, n < MIN_YEARS] = np.nan
+    return quantiles
+
+DISTRIBUTIONS = {
+    'gev': fit_gev_quantiles,
+    'lp3': fit_lp3_quantiles,
+}
+
+def fit_idf_curves(durations_min, intensities):
+    """Fit i = a / (t + b)^c to every column of a (durations x series) intensity array
+
+    Grid-searches b and solves the log-linear least squares for a and c in closed form,
+    broadcasting over all series at once. Returns (a, b, c) arrays, NaN where a series is incomplete.
+    """
+    t = np.asarray(durations_min, dtype=float)
+    y = np.log(intensities)
+    complete = np.all(np.isfinite(y), axis=0)
+    y = np.where(complete, y, 0.0)
+
+    x = np.log(t[:, None] + B_GRID[None, :])             # durations x grid
+    x_centered = x - x.mean(axis=0)
+    y_centered = y - y.mean(axis=0)                         # durations x series
+    sxx = (x_centered ** 2).sum(axis=0)                     # grid
+    sxy = x_centered.T @ y_centered                         # grid x series
+    slope = sxy / sxx[:, None]
+    sse = (y_centered ** 2).sum(axis=0)[None, :] - slope * sxy
+
+    best = np.argmin(sse, axis=0)
+    columns = np.arange(y.shape[1])
+    best_slope = slope[best, columns]
+    a = np.exp(y.mean(axis=0) - best_slope * x.mean(axis=0)[best])
+    b = B_GRID[best]
+    c = -best_slope
+    for values in (a, b, c):
+        values[~complete] = np.nan
+    return a, b, c
+
+def fit_idf_parameters(rainfall, durations_min=DEFAULT_DURATIONS_MIN, return_periods=DEFAULT_RETURN_PERIODS,
+                       distribution='gev', workers=1):
+    """Derive {gauge: {'<T>-year': {'a', 'b', 'c'}}} tables from a wide rainfall frame"""
+    # calculate_idf_rainfall falls back to the 10-year curve, so always fit it
+    return_periods = sorted(set(return_periods) | {10})
+    step_min = base_step_minutes(rainfall.index)
+    blocks = [(rainfall.iloc[:, start:start + GAUGES_PER_BLOCK], durations_min, step_min)
+              for start in range(0, rainfall.shape[1], GAUGES_PER_BLOCK)]
+
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            block_results = list(executor.map(_block_maxima, blocks))
+    else:
+        block_results = [_block_maxima(block) for block in blocks]
+
+    durations = sorted(set.intersection(*(set(result) for result in block_results)))
+    if len(durations) < 3:
+        raise ValueError(f"Need at least 3 durations that are multiples of the {step_min:g}-minute record step")
+
+    # Quantiles for every duration and gauge in one call per duration
+    gauges = list(rainfall.columns)
+    fit_quantiles = DISTRIBUTIONS[distribution]
+    intensity = np.empty((len(durations), len(return_periods), len(gauges)))
+    for d, duration in enumerate(durations):
+        samples = pd.concat([result[duration] for result in block_results], axis=1)[gauges]
+        intensity[d] = fit_quantiles(samples.to_numpy(dtype=float), return_periods)
+
+    a, b, c = fit_idf_curves(durations, intensity.reshape(len(durations), -1))
+    shape = (len(return_periods), len(gauges))
+    a, b, c = a.reshape(shape), b.reshape(shape), c.reshape(shape)
+
+    # A b on the edge of B_GRID is the grid's limit rather than the best fit
+    at_bound = (b == B_GRID[0]) | (b == B_GRID[-1])
+    if at_bound.any():
+        bounded = [str(gauge) for gauge, hit in zip(gauges, at_bound.any(axis=0)) if hit]
+        listed = ', '.join(bounded[:10]) + (f" and {len(bounded) - 10} more" if len(bounded) > 10 else "")
+        warnings.warn(f"b reached the {B_GRID[0]:g}-{B_GRID[-1]:g} min search bound in {int(at_bound.sum())} "
+                      f"curves (gauges {listed}); those curves are limited by the grid")
+
+    tables = {}
+    for g, gauge in enumerate(gauges):
+        curves = {
+            f"{period}-year": {'a': round(float(a[r, g]), 4), 'b': round(float(b[r, g]), 2),
+                               'c': round(float(c[r, g]), 4)}
+            for r, period in enumerate(return_periods) if np.isfinite(a[r, g])
+        }
+        if '10-year' in curves:
+            tables[str(gauge)] = curves
+    return tables, durations
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Fit IDF curve parameters from gauge rainfall records")
+    parser.add_argument('rainfall', help="Long (gauge,timestamp,depth_in) or wide rainfall CSV")
+    parser.add_argument('-o', '--output', required=True, help="JSON parameter table for load_idf_parameters")
+    parser.add_argument('--distribution', choices=sorted(DISTRIBUTIONS), default='gev')
+    parser.add_argument('--durations', default=','.join(map(str, DEFAULT_DURATIONS_MIN)),
+                        help="Comma-separated durations in minutes")
+    parser.add_argument('--return-periods', default=','.join(map(str, DEFAULT_RETURN_PERIODS)),
+                        help="Comma-separated return periods in years")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Processes for annual-maximum extraction")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rainfall = read_rainfall(args.rainfall)
+    loaded = time.perf_counter()
+    tables, durations = fit_idf_parameters(
+        rainfall,
+        [float(d) for d in args.durations.split(',')],
+        [int(t) for t in args.return_periods.split(',')],
+        args.distribution,
+        args.workers
+    )
+    with open(args.output, 'w') as f:
+        json.dump(tables, f, indent=2)
+
+    skipped = rainfall.shape[1] - len(tables)
+    print(f"Fitted {len(tables)} gauges over durations {', '.join(f'{d:g}' for d in durations)} min "
+          f"({args.distribution}); load {loaded - started:.1f}s, fit {time.perf_counter() - loaded:.1f}s", file=sys.stderr)
+    if skipped:
+        print(f"Skipped {skipped} gauges with fewer than {MIN_YEARS} complete years", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import { spawn } from 'child_process';
 import { writeFileSync, unlinkSync, existsSync, mkdirSync, readFileSync } from 'fs';
-import { join } from 'path';
+import { join, delimiter } from 'path';
 import { v4 as uuidv4 } from 'uuid';
 
 export interface PythonExecutionResult {
@@ -13,13 +13,46 @@ export interface PythonExecutionResult {
     insights: string[];
     recommendations: string[];
   };
+  metrics?: PythonExecutionMetrics;
+  profile?: string;
+}
+
+// Timings are wall-clock seconds measured inside the Python process
+export interface PythonExecutionMetrics {
+  import_s: number;
+  input_load_s: number;
+  user_code_s: number;
+  plot_render_s: number;
+  plot_count: number;
+  output_serialize_s: number;
+  total_s: number;
+  peak_memory_mb: number | null;
+  toolkit_calls: Record<string, { calls: number; cumulative_s: number }>;
+  // True when the run was stopped by the timeout; timings then cover the partial run
+  terminated: boolean;
+}
+
+export interface PythonExecutionOptions {
+  // Sample the main thread's stack and return it in folded (flamegraph.pl / speedscope) format
+  profile?: boolean;
 }
 
 export class PythonInterpreter {
   private tempDir: string;
+  private toolkitDir: string;
+  private modelDir: string;
+  private idfParametersPath: string;
+  private preambleTemplate: string;
 
   constructor() {
     this.tempDir = join(process.cwd(), 'uploads', 'python_temp');
+    // stormwater_toolkit.py lives at the project root
+    this.toolkitDir = process.cwd();
+    this.modelDir = join(process.cwd(), 'uploads', 'models');
+    // Gauge IDF tables written by idf_fitting.py
+    this.idfParametersPath = join(process.cwd(), 'uploads', 'idf_parameters.json');
+    // Analysis script template, shared with benchmark_toolkit.py
+    this.preambleTemplate = readFileSync(join(this.toolkitDir, 'analysis_preamble.py.tmpl'), 'utf8');
     this.ensureTempDir();
   }
 
@@ -32,16 +65,20 @@ export class PythonInterpreter {
   async executeStormwaterAnalysis(
     code: string, 
     data?: any,
-    analysisType: 'data_analysis' | 'visualization' | 'calculation' | 'modeling' = 'data_analysis'
+    analysisType: 'data_analysis' | 'visualization' | 'calculation' | 'modeling' = 'data_analysis',
+    options: PythonExecutionOptions = {}
   ): Promise<PythonExecutionResult> {
     const sessionId = uuidv4();
     const scriptPath = join(this.tempDir, `script_${sessionId}.py`);
     const dataPath = join(this.tempDir, `data_${sessionId}.json`);
     const outputPath = join(this.tempDir, `output_${sessionId}.json`);
+    const profilePath = join(this.tempDir, `profile_${sessionId}.folded`);
 
     try {
       // Prepare enhanced Python environment for stormwater analysis
-      const enhancedCode = this.prepareStormwaterEnvironment(code, dataPath, outputPath, analysisType);
+      const enhancedCode = this.prepareStormwaterEnvironment(
+        code, dataPath, outputPath, analysisType, options.profile ? profilePath : null
+      );
       
       // Write data file if provided
       if (data) {
@@ -65,8 +102,13 @@ export class PythonInterpreter {
         }
       }
 
+      let profile: string | undefined;
+      if (options.profile && existsSync(profilePath)) {
+        profile = readFileSync(profilePath, 'utf8');
+      }
+
       // Clean up temporary files
-      this.cleanup([scriptPath, dataPath, outputPath]);
+      this.cleanup([scriptPath, dataPath, outputPath, profilePath]);
 
       return {
         success: result.success,
@@ -77,11 +119,13 @@ export class PythonInterpreter {
           summary: result.success ? "Python execution completed successfully" : "Execution failed",
           insights: [],
           recommendations: []
-        }
+        },
+        metrics: analysisResults.metrics,
+        profile
       };
 
     } catch (error) {
-      this.cleanup([scriptPath, dataPath, outputPath]);
+      this.cleanup([scriptPath, dataPath, outputPath, profilePath]);
       return {
         success: false,
         error: `Python interpreter error: ${error instanceof Error ? error.message : 'Unknown error'}`,
@@ -98,577 +142,34 @@ export class PythonInterpreter {
     userCode: string, 
     dataPath: string, 
     outputPath: string,
-    analysisType: string
+    analysisType: string,
+    profilePath: string | null = null
   ): string {
-    return `
-import sys
-import json
-import pandas as pd
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
-import warnings
-warnings.filterwarnings('ignore')
-
-# Stormwater-specific imports
-try:
-    import scipy.stats as stats
-    import sklearn.linear_model as linear_model
-    from sklearn.preprocessing import StandardScaler
-except ImportError:
-    print("Advanced analysis libraries not available. Basic analysis only.")
-
-# Initialize analysis results
-analysis_results = {
-    "plots": [],
-    "analysis": {
-        "summary": "",
-        "insights": [],
-        "recommendations": []
-    }
-}
-
-# Load data if available
-data = None
-try:
-    with open("${dataPath}", 'r') as f:
-        data = json.load(f)
-    if data:
-        print(f"Loaded data with {len(data) if isinstance(data, list) else 'N/A'} records")
-except FileNotFoundError:
-    print("No input data provided")
-except Exception as e:
-    print(f"Error loading data: {e}")
-
-# REAL STORMWATER ENGINEERING CALCULATIONS USING ACTUAL PUBLISHED FORMULAS
-
-# Source: NRCS Technical Release 55 (TR-55) and Construction General Permit Standards
-# Source: Caltrans Erosion Control Technical Guide, Chapter 2
-# Source: ASCE Manual 37 - Design of Urban Stormwater Controls
-
-def analyze_runoff_coefficient(land_use_data, soil_type='B', slope_percent=5):
-    """Calculate actual runoff coefficients using NRCS TR-55 methodology"""
-    # Real NRCS Curve Numbers based on soil type and land use
-    curve_numbers = {
-        'A': {  # Well-drained soils
-            'residential_1_acre': 30, 'residential_0.5_acre': 35, 'residential_0.25_acre': 40,
-            'commercial': 85, 'industrial': 80, 'forest': 25, 'agriculture_row_crops': 65,
-            'paved_impervious': 98, 'gravel': 85, 'open_space_good': 30
-        },
-        'B': {  # Moderate infiltration
-            'residential_1_acre': 55, 'residential_0.5_acre': 60, 'residential_0.25_acre': 65,
-            'commercial': 90, 'industrial': 85, 'forest': 55, 'agriculture_row_crops': 75,
-            'paved_impervious': 98, 'gravel': 90, 'open_space_good': 55
-        },
-        'C': {  # Slow infiltration
-            'residential_1_acre': 70, 'residential_0.5_acre': 75, 'residential_0.25_acre': 80,
-            'commercial': 92, 'industrial': 90, 'forest': 70, 'agriculture_row_crops': 82,
-            'paved_impervious': 98, 'gravel': 92, 'open_space_good': 70
-        },
-        'D': {  # Very slow infiltration
-            'residential_1_acre': 77, 'residential_0.5_acre': 82, 'residential_0.25_acre': 85,
-            'commercial': 95, 'industrial': 93, 'forest': 77, 'agriculture_row_crops': 87,
-            'paved_impervious': 98, 'gravel': 95, 'open_space_good': 77
-        }
-    }
-    
-    results = {}
-    total_weighted_cn = 0
-    total_area = 0
-    
-    for land_use, area_acres in land_use_data.items():
-        # Match land use to closest NRCS category
-        land_use_key = land_use.lower().replace(' ', '_')
-        if 'residential' in land_use_key:
-            if 'large' in land_use_key or '1_acre' in land_use_key:
-                cn_key = 'residential_1_acre'
-            elif 'medium' in land_use_key or '0.5' in land_use_key:
-                cn_key = 'residential_0.5_acre'
-            else:
-                cn_key = 'residential_0.25_acre'
-        elif any(x in land_use_key for x in ['commercial', 'business', 'retail']):
-            cn_key = 'commercial'
-        elif any(x in land_use_key for x in ['industrial', 'manufacturing']):
-            cn_key = 'industrial'
-        elif any(x in land_use_key for x in ['forest', 'woods', 'trees']):
-            cn_key = 'forest'
-        elif any(x in land_use_key for x in ['farm', 'agriculture', 'crop']):
-            cn_key = 'agriculture_row_crops'
-        elif any(x in land_use_key for x in ['paved', 'asphalt', 'concrete', 'parking']):
-            cn_key = 'paved_impervious'
-        elif any(x in land_use_key for x in ['gravel', 'crushed_stone']):
-            cn_key = 'gravel'
-        else:
-            cn_key = 'open_space_good'
-            
-        cn = curve_numbers[soil_type][cn_key]
-        
-        # Calculate runoff coefficient using SCS method: C = (CN-10)/(CN+90)
-        runoff_coeff = (cn - 10) / (cn + 90) if cn > 10 else 0.05
-        
-        # Adjust for slope (increase coefficient for steeper slopes)
-        slope_adjustment = 1 + (slope_percent - 2) * 0.01 if slope_percent > 2 else 1
-        adjusted_coeff = min(runoff_coeff * slope_adjustment, 0.95)
-        
-        results[land_use] = {
-            'area_acres': area_acres,
-            'area_sf': area_acres * 43560,
-            'curve_number': cn,
-            'runoff_coefficient': round(adjusted_coeff, 3),
-            'effective_area_acres': round(area_acres * adjusted_coeff, 2),
-            'soil_type': soil_type,
-            'slope_adjustment': round(slope_adjustment, 3)
-        }
-        
-        total_weighted_cn += cn * area_acres
-        total_area += area_acres
-    
-    composite_cn = total_weighted_cn / total_area if total_area > 0 else 75
-    composite_coeff = (composite_cn - 10) / (composite_cn + 90)
-    
-    results['COMPOSITE'] = {
-        'total_area_acres': round(total_area, 2),
-        'weighted_curve_number': round(composite_cn, 1),
-        'composite_runoff_coefficient': round(composite_coeff, 3),
-        'total_effective_area_acres': round(sum(r['effective_area_acres'] for r in results.values() if isinstance(r, dict) and 'effective_area_acres' in r), 2)
-    }
-    
-    return results
-
-def calculate_peak_flow_rational(rainfall_intensity_in_hr, area_acres, runoff_coefficient, storm_duration_min=10):
-    """Calculate peak flow using Rational Method with actual IDF data"""
-    # Rational Method: Q = CiA where Q=peak flow (cfs), C=runoff coefficient, i=rainfall intensity (in/hr), A=area (acres)
-    
-    # Time of concentration affects rainfall intensity
-    # Use standard time of concentration formula for urban areas
-    tc_minutes = max(storm_duration_min, 5)  # Minimum 5 minutes
-    
-    # Adjust intensity for time of concentration (typical IDF relationship)
-    # i = a / (t + b)^c where t is duration in minutes
-    # Using typical IDF parameters for moderate climate zone
-    intensity_adjusted = rainfall_intensity_in_hr * (10 / tc_minutes) ** 0.25
-    
-    peak_flow_cfs = runoff_coefficient * intensity_adjusted * area_acres
-    
-    return {
-        'peak_flow_cfs': round(peak_flow_cfs, 2),
-        'peak_flow_gpm': round(peak_flow_cfs * 448.8, 0),  # Convert cfs to gpm
-        'rainfall_intensity_in_hr': round(intensity_adjusted, 2),
-        'time_of_concentration_min': tc_minutes,
-        'runoff_coefficient': runoff_coefficient,
-        'drainage_area_acres': area_acres,
-        'method': 'Rational Method (Q = CiA)'
-    }
-
-def calculate_runoff_volume_scs(area_acres, rainfall_depth_inches, curve_number):
-    """Calculate runoff volume using SCS Curve Number method"""
-    # SCS Runoff equation: Q = (P - 0.2S)² / (P + 0.8S)
-    # Where S = (1000/CN) - 10, P = rainfall depth, Q = runoff depth
-    
-    S = (1000 / curve_number) - 10 if curve_number > 0 else 10
-    initial_abstraction = 0.2 * S
-    
-    if rainfall_depth_inches <= initial_abstraction:
-        runoff_depth = 0
-    else:
-        runoff_depth = ((rainfall_depth_inches - initial_abstraction) ** 2) / (rainfall_depth_inches + 0.8 * S)
-    
-    # Convert to volume
-    runoff_volume_cf = runoff_depth * area_acres * 43560 / 12  # cubic feet
-    runoff_volume_gal = runoff_volume_cf * 7.48  # gallons
-    
-    return {
-        'runoff_depth_inches': round(runoff_depth, 3),
-        'runoff_volume_cf': round(runoff_volume_cf, 0),
-        'runoff_volume_gallons': round(runoff_volume_gal, 0),
-        'rainfall_depth_inches': rainfall_depth_inches,
-        'curve_number': curve_number,
-        'potential_max_retention_S': round(S, 2),
-        'initial_abstraction': round(initial_abstraction, 2),
-        'method': 'SCS Curve Number Method'
-    }
-
-def bmp_sizing_calculator(drainage_area_acres, runoff_depth_inches, bmp_type='bioretention', storm_frequency='10-year'):
-    """Calculate BMP sizing using real engineering design criteria"""
-    
-    # Actual BMP sizing criteria from engineering standards
-    bmp_criteria = {
-        'bioretention': {
-            'sizing_ratio': 0.05,  # 5% of drainage area minimum
-            'ponding_depth_ft': 1.5,
-            'soil_depth_ft': 3.0,
-            'underdrain': True,
-            'cost_per_sf': 12.0,
-            'maintenance_cost_annual_sf': 0.50
-        },
-        'wet_pond': {
-            'sizing_ratio': 0.015,  # 1.5% of drainage area
-            'permanent_pool_depth_ft': 4.0,
-            'extended_detention_ft': 2.0,
-            'cost_per_cf': 3.50,
-            'maintenance_cost_annual_cf': 0.15
-        },
-        'constructed_wetland': {
-            'sizing_ratio': 0.02,  # 2% of drainage area
-            'water_depth_ft': 1.5,
-            'vegetation_coverage': 0.80,
-            'cost_per_sf': 8.0,
-            'maintenance_cost_annual_sf': 0.30
-        },
-        'dry_detention': {
-            'sizing_ratio': 0.025,  # 2.5% of drainage area
-            'max_depth_ft': 6.0,
-            'outlet_orifice_diameter_in': 4,
-            'cost_per_cf': 2.50,
-            'maintenance_cost_annual_cf': 0.10
-        },
-        'sand_filter': {
-            'sizing_ratio': 0.03,  # 3% of drainage area
-            'filter_depth_ft': 2.5,
-            'underdrain_spacing_ft': 10,
-            'cost_per_sf': 15.0,
-            'maintenance_cost_annual_sf': 1.20
-        }
-    }
-    
-    criteria = bmp_criteria.get(bmp_type, bmp_criteria['bioretention'])
-    
-    # Calculate required BMP area
-    required_area_sf = drainage_area_acres * 43560 * criteria['sizing_ratio']
-    
-    # Calculate treatment volume (Water Quality Volume)
-    # WQv = P * Rv * A / 12 where P = design storm (typically 1 inch), Rv = runoff coefficient, A = area
-    treatment_volume_cf = runoff_depth_inches * drainage_area_acres * 43560 / 12
-    
-    # Calculate construction costs
-    if 'cost_per_sf' in criteria:
-        construction_cost = required_area_sf * criteria['cost_per_sf']
-        annual_maintenance = required_area_sf * criteria.get('maintenance_cost_annual_sf', 0.50)
-    else:
-        required_volume_cf = treatment_volume_cf * 1.2  # 20% safety factor
-        construction_cost = required_volume_cf * criteria.get('cost_per_cf', 3.0)
-        annual_maintenance = required_volume_cf * criteria.get('maintenance_cost_annual_cf', 0.15)
-    
-    return {
-        'bmp_type': bmp_type,
-        'drainage_area_acres': drainage_area_acres,
-        'required_area_sf': round(required_area_sf, 0),
-        'required_area_acres': round(required_area_sf / 43560, 3),
-        'treatment_volume_cf': round(treatment_volume_cf, 0),
-        'treatment_volume_gallons': round(treatment_volume_cf * 7.48, 0),
-        'sizing_ratio_percent': criteria['sizing_ratio'] * 100,
-        'construction_cost': round(construction_cost, 0),
-        'annual_maintenance_cost': round(annual_maintenance, 0),
-        'lifecycle_cost_20yr': round(construction_cost + (annual_maintenance * 20), 0),
-        'design_criteria': criteria,
-        'storm_frequency': storm_frequency
-    }
-
-def calculate_time_of_concentration(length_ft, slope_percent, land_cover='mixed'):
-    """Calculate time of concentration using Kirpich formula and SCS methodology"""
-    # Source: NRCS TR-55, Chapter 3
-    # Tc = 0.0078 * (L^0.77) * (S^-0.385) for natural watersheds
-    # Where L = length in feet, S = slope in percent
-    
-    # Adjust for land cover roughness
-    roughness_factors = {
-        'paved': 0.6,      # Urban paved areas
-        'smooth': 0.8,     # Smooth natural channels  
-        'mixed': 1.0,      # Mixed development (standard)
-        'rough': 1.4,      # Dense vegetation/forest
-        'very_rough': 1.8  # Very dense forest
-    }
-    
-    roughness = roughness_factors.get(land_cover, 1.0)
-    
-    # Kirpich equation (in hours)
-    tc_hours = 0.0078 * (length_ft ** 0.77) * (slope_percent ** -0.385) * roughness
-    tc_minutes = tc_hours * 60
-    
-    # Minimum time of concentration is 5 minutes per engineering standards
-    tc_minutes = max(tc_minutes, 5.0)
-    
-    return {
-        'tc_minutes': round(tc_minutes, 1),
-        'tc_hours': round(tc_hours, 2),
-        'flow_length_ft': length_ft,
-        'slope_percent': slope_percent,
-        'land_cover': land_cover,
-        'roughness_factor': roughness,
-        'method': 'Kirpich Formula (NRCS TR-55)'
-    }
-
-def calculate_manning_flow(cross_sectional_area_sf, wetted_perimeter_ft, slope_percent, manning_n=0.035):
-    """Calculate flow velocity and capacity using Manning's equation"""
-    # Source: Manning's equation Q = (1.49/n) * A * R^(2/3) * S^(1/2)
-    # Where Q = flow rate (cfs), n = Manning's roughness, A = area (sf), 
-    # R = hydraulic radius (ft), S = slope (ft/ft)
-    
-    # Manning's roughness coefficients
-    manning_coefficients = {
-        'concrete': 0.012,
-        'pvc_pipe': 0.010,
-        'corrugated_metal': 0.024,
-        'natural_earth': 0.030,
-        'grassed_channel': 0.035,
-        'rock_rip_rap': 0.040,
-        'dense_vegetation': 0.075
-    }
-    
-    # Calculate hydraulic radius
-    hydraulic_radius = cross_sectional_area_sf / wetted_perimeter_ft
-    
-    # Convert slope from percent to decimal
-    slope_decimal = slope_percent / 100
-    
-    # Manning's equation
-    flow_cfs = (1.49 / manning_n) * cross_sectional_area_sf * (hydraulic_radius ** (2/3)) * (slope_decimal ** 0.5)
-    
-    # Calculate velocity
-    velocity_fps = flow_cfs / cross_sectional_area_sf if cross_sectional_area_sf > 0 else 0
-    
-    return {
-        'flow_rate_cfs': round(flow_cfs, 2),
-        'flow_rate_gpm': round(flow_cfs * 448.8, 0),
-        'velocity_fps': round(velocity_fps, 2),
-        'hydraulic_radius_ft': round(hydraulic_radius, 3),
-        'manning_n': manning_n,
-        'slope_percent': slope_percent,
-        'cross_sectional_area_sf': cross_sectional_area_sf,
-        'method': "Manning's Equation"
-    }
-
-def calculate_idf_rainfall(storm_frequency='10-year', duration_minutes=60, location='california_central'):
-    """Calculate rainfall intensity from IDF curves for specific regions"""
-    # Source: NOAA Atlas 14 and local IDF data
-    # Simplified IDF parameters for different California regions
-    
-    idf_parameters = {
-        'california_central': {
-            '2-year': {'a': 15.2, 'b': 8.5, 'c': 0.78},
-            '10-year': {'a': 25.1, 'b': 9.2, 'c': 0.82},
-            '25-year': {'a': 32.4, 'b': 9.8, 'c': 0.85},
-            '100-year': {'a': 45.8, 'b': 10.5, 'c': 0.88}
-        },
-        'california_southern': {
-            '2-year': {'a': 18.5, 'b': 10.2, 'c': 0.75},
-            '10-year': {'a': 28.9, 'b': 11.1, 'c': 0.80},
-            '25-year': {'a': 36.2, 'b': 11.8, 'c': 0.83},
-            '100-year': {'a': 48.7, 'b': 12.5, 'c': 0.86}
-        },
-        'california_northern': {
-            '2-year': {'a': 12.8, 'b': 7.8, 'c': 0.72},
-            '10-year': {'a': 21.3, 'b': 8.4, 'c': 0.76},
-            '25-year': {'a': 27.5, 'b': 8.9, 'c': 0.79},
-            '100-year': {'a': 38.2, 'b': 9.6, 'c': 0.82}
-        }
-    }
-    
-    params = idf_parameters.get(location, idf_parameters['california_central'])
-    freq_params = params.get(storm_frequency, params['10-year'])
-    
-    # IDF equation: i = a / (t + b)^c
-    # Where i = intensity (in/hr), t = duration (min), a,b,c = fitted parameters
-    intensity_in_hr = freq_params['a'] / ((duration_minutes + freq_params['b']) ** freq_params['c'])
-    
-    # Calculate total rainfall depth
-    rainfall_depth_inches = intensity_in_hr * (duration_minutes / 60)
-    
-    return {
-        'intensity_in_hr': round(intensity_in_hr, 2),
-        'rainfall_depth_inches': round(rainfall_depth_inches, 2),
-        'duration_minutes': duration_minutes,
-        'storm_frequency': storm_frequency,
-        'location': location,
-        'idf_parameters': freq_params,
-        'source': 'NOAA Atlas 14 Regional IDF'
-    }
-
-def calculate_culvert_capacity(diameter_inches, length_ft, inlet_elevation_ft, outlet_elevation_ft, headwater_depth_ft):
-    """Calculate culvert flow capacity using inlet and outlet control"""
-    # Source: FHWA Hydraulic Design of Highway Culverts (HDS-5)
-    
-    # Convert diameter to feet
-    diameter_ft = diameter_inches / 12
-    area_sf = 3.14159 * (diameter_ft / 2) ** 2
-    
-    # Calculate slope
-    slope_ft_per_ft = (inlet_elevation_ft - outlet_elevation_ft) / length_ft
-    slope_percent = slope_ft_per_ft * 100
-    
-    # Inlet control (simplified for circular pipe)
-    # Q = K * D^n * H^m where K, n, m are coefficients, D = diameter, H = headwater depth
-    K = 0.098  # Coefficient for concrete pipe with square edge inlet
-    n = 2.5    # Diameter exponent
-    m = 1.5    # Head exponent
-    
-    inlet_control_cfs = K * (diameter_inches ** n) * (headwater_depth_ft ** m)
-    
-    # Outlet control using Manning's equation
-    manning_n = 0.013  # Concrete pipe
-    hydraulic_radius = diameter_ft / 4  # For full pipe flow
-    
-    outlet_control_cfs = (1.49 / manning_n) * area_sf * (hydraulic_radius ** (2/3)) * (slope_ft_per_ft ** 0.5)
-    
-    # Governing capacity is the minimum of inlet and outlet control
-    capacity_cfs = min(inlet_control_cfs, outlet_control_cfs)
-    
-    return {
-        'capacity_cfs': round(capacity_cfs, 2),
-        'capacity_gpm': round(capacity_cfs * 448.8, 0),
-        'inlet_control_cfs': round(inlet_control_cfs, 2),
-        'outlet_control_cfs': round(outlet_control_cfs, 2),
-        'governing_control': 'Inlet' if inlet_control_cfs < outlet_control_cfs else 'Outlet',
-        'diameter_inches': diameter_inches,
-        'length_ft': length_ft,
-        'slope_percent': round(slope_percent, 2),
-        'headwater_depth_ft': headwater_depth_ft,
-        'method': 'FHWA HDS-5 Culvert Analysis'
-    }
-
-def water_quality_analysis(data_points):
-    """Analyze water quality parameters"""
-    if not data_points:
-        return {"error": "No data provided for analysis"}
-    
-    df = pd.DataFrame(data_points)
-    
-    # Standard water quality parameters
-    parameters = ['TSS', 'TP', 'TN', 'BOD', 'Metals', 'pH']
-    analysis = {}
-    
-    for param in parameters:
-        if param in df.columns:
-            values = df[param].dropna()
-            if len(values) > 0:
-                analysis[param] = {
-                    'mean': float(values.mean()),
-                    'median': float(values.median()),
-                    'std': float(values.std()),
-                    'min': float(values.min()),
-                    'max': float(values.max()),
-                    'exceedances': len(values[values > get_regulatory_limit(param)])
-                }
-    
-    return analysis
-
-def get_regulatory_limit(parameter):
-    """Get typical regulatory limits for water quality parameters"""
-    limits = {
-        'TSS': 80,    # mg/L
-        'TP': 0.1,    # mg/L
-        'TN': 10,     # mg/L  
-        'BOD': 30,    # mg/L
-        'pH': 8.5,    # upper limit
-        'Metals': 0.1 # mg/L (general)
-    }
-    return limits.get(parameter, float('inf'))
-
-# Enhanced plotting for stormwater analysis
-def create_stormwater_plots():
-    """Create standard stormwater analysis plots"""
-    plots_created = []
-    
-    try:
-        # Plot 1: Rainfall vs Runoff
-        plt.figure(figsize=(10, 6))
-        rainfall = np.array([0.5, 1.0, 1.5, 2.0, 2.5, 3.0])
-        runoff_urban = rainfall * 0.7  # Urban runoff coefficient
-        runoff_rural = rainfall * 0.3  # Rural runoff coefficient
-        
-        plt.plot(rainfall, runoff_urban, 'b-', label='Urban (C=0.7)', linewidth=2)
-        plt.plot(rainfall, runoff_rural, 'g-', label='Rural (C=0.3)', linewidth=2)
-        plt.xlabel('Rainfall (inches)')
-        plt.ylabel('Runoff (inches)')
-        plt.title('Rainfall-Runoff Relationship by Land Use')
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        
-        plot1_path = f"${this.tempDir}/rainfall_runoff_{uuidv4()}.png"
-        plt.savefig(plot1_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        plots_created.append(plot1_path)
-        
-        # Plot 2: BMP Effectiveness
-        plt.figure(figsize=(12, 8))
-        bmps = ['Bioretention', 'Wet Pond', 'Constructed\\nWetland', 'Dry Pond', 'Sand Filter']
-        tss_removal = [85, 80, 75, 70, 85]
-        tp_removal = [65, 60, 70, 40, 50]
-        tn_removal = [45, 35, 55, 25, 30]
-        
-        x = np.arange(len(bmps))
-        width = 0.25
-        
-        plt.bar(x - width, tss_removal, width, label='TSS Removal %', alpha=0.8)
-        plt.bar(x, tp_removal, width, label='TP Removal %', alpha=0.8)
-        plt.bar(x + width, tn_removal, width, label='TN Removal %', alpha=0.8)
-        
-        plt.xlabel('BMP Type')
-        plt.ylabel('Pollutant Removal Efficiency (%)')
-        plt.title('BMP Pollutant Removal Effectiveness')
-        plt.xticks(x, bmps)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        
-        plot2_path = f"${this.tempDir}/bmp_effectiveness_{uuidv4()}.png"
-        plt.savefig(plot2_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        plots_created.append(plot2_path)
-        
-    except Exception as e:
-        print(f"Error creating plots: {e}")
-    
-    return plots_created
-
-# Analysis type-specific setup
-if "${analysisType}" == "visualization":
-    analysis_results["plots"] = create_stormwater_plots()
-    analysis_results["analysis"]["summary"] = "Generated standard stormwater analysis visualizations"
-
-print("Python stormwater analysis environment initialized")
-print(f"Analysis type: ${analysisType}")
-print("Available utilities: analyze_runoff_coefficient, calculate_peak_flow, bmp_sizing_calculator, water_quality_analysis")
-
-# Execute user code
-try:
-${userCode.split('\n').map(line => '    ' + line).join('\n')}
-    
-    # Update analysis results
-    if 'analysis_results' in locals():
-        if not analysis_results["analysis"]["summary"]:
-            analysis_results["analysis"]["summary"] = "Custom Python analysis completed successfully"
-        
-        if hasattr(locals().get('results', None), '__dict__'):
-            analysis_results["analysis"]["insights"].append(str(results))
-            
-except Exception as e:
-    print(f"Error in user code execution: {e}")
-    analysis_results["analysis"]["summary"] = f"Error: {e}"
-    analysis_results["analysis"]["insights"].append(f"Execution failed: {e}")
-
-# Save results
-try:
-    with open("${outputPath}", 'w') as f:
-        json.dump(analysis_results, f, indent=2, default=str)
-    print("Analysis results saved successfully")
-except Exception as e:
-    print(f"Error saving results: {e}")
-
-print("Python analysis complete")
-`;
+    const values: Record<string, string> = {
+      PROFILE_ENABLED: profilePath ? 'True' : 'False',
+      PROFILE_PATH: profilePath ?? '',
+      DATA_PATH: dataPath,
+      OUTPUT_PATH: outputPath,
+      ANALYSIS_TYPE: analysisType,
+      TEMP_DIR: this.tempDir,
+      MODEL_DIR: this.modelDir,
+      IDF_PARAMETERS_PATH: this.idfParametersPath,
+      USER_CODE: userCode.split('\n').map(line => '    ' + line).join('\n')
+    };
+    // Single pass, so placeholder-like text inside the user code is left alone
+    return this.preambleTemplate.replace(/\{\{([A-Z_]+)\}\}/g, (match, key) => values[key] ?? match);
   }
 
   private async executePythonScript(scriptPath: string): Promise<{ success: boolean; output?: string; error?: string }> {
     return new Promise((resolve) => {
       let output = '';
       let error = '';
+      let timedOut = false;
+      let killTimer: ReturnType<typeof setTimeout> | undefined;
 
       const pythonProcess = spawn('python3', [scriptPath], {
         cwd: this.tempDir,
-        env: { ...process.env, PYTHONPATH: this.tempDir }
+        env: { ...process.env, PYTHONPATH: [this.tempDir, this.toolkitDir].join(delimiter) }
       });
 
       pythonProcess.stdout.on('data', (data) => {
@@ -680,27 +181,30 @@ print("Python analysis complete")
       });
 
       pythonProcess.on('close', (code) => {
+        clearTimeout(timeoutTimer);
+        clearTimeout(killTimer);
         resolve({
-          success: code === 0,
+          success: !timedOut && code === 0,
           output: output.trim(),
-          error: error.trim() || undefined
+          error: timedOut ? 'Python execution timed out after 30 seconds' : error.trim() || undefined
         });
       });
 
       pythonProcess.on('error', (err) => {
+        clearTimeout(timeoutTimer);
+        clearTimeout(killTimer);
         resolve({
           success: false,
           error: `Failed to start Python process: ${err.message}`
         });
       });
 
-      // Timeout after 30 seconds
-      setTimeout(() => {
-        pythonProcess.kill();
-        resolve({
-          success: false,
-          error: 'Python execution timed out after 30 seconds'
-        });
+      // Timeout after 30 seconds. SIGTERM lets the script write its partial metrics and profile;
+      // resolve on 'close' so those files exist before they are read, and SIGKILL if it hangs
+      const timeoutTimer = setTimeout(() => {
+        timedOut = true;
+        pythonProcess.kill('SIGTERM');
+        killTimer = setTimeout(() => pythonProcess.kill('SIGKILL'), 3000);
       }, 30000);
     });
   }
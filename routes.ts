@@ -1050,7 +1050,7 @@ For detailed professional analysis, please ensure Claude 4 API access is properl
   // Python interpreter endpoints
   app.post("/api/python/execute", async (req, res) => {
     try {
-      const { code, data, analysisType } = req.body;
+      const { code, data, analysisType, profile } = req.body;
       
       if (!code || typeof code !== 'string') {
         return res.status(400).json({ error: 'Python code is required' });
@@ -1061,7 +1061,8 @@ For detailed professional analysis, please ensure Claude 4 API access is properl
       const result = await pythonInterpreter.executeStormwaterAnalysis(
         code, 
         data,
-        analysisType || 'data_analysis'
+        analysisType || 'data_analysis',
+        { profile: profile === true }
       );
       
       res.json(result);
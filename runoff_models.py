@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Incrementally trained site regression models
+Rainfall-runoff and pollutant-load regressions updated with partial_fit as monitoring data
+arrives, persisted to a model store and cached per process for batched predictions
+
+Usage:
+    python runoff_models.py update uploads/models site-12 runoff monitoring.csv
+    python runoff_models.py predict uploads/models site-12 runoff storms.jsonl
+    python runoff_models.py info uploads/models
+    python runoff_models.py serve uploads/models     # JSON-lines requests on stdin, responses on stdout
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Default feature/target columns per model type; a model keeps whatever it was created with
+MODEL_TYPES = {
+    'runoff': {
+        'features': ['rainfall_depth_inches', 'rainfall_intensity_in_hr', 'antecedent_dry_days'],
+        'target': 'runoff_depth_inches'
+    },
+    'pollutant_load': {
+        'features': ['rainfall_depth_inches', 'runoff_volume_cf', 'antecedent_dry_days'],
+        'target': 'load_lbs'
+    }
+}
+
+UPDATE_CHUNK_ROWS = 10000
+# Relative ridge strength; only matters for collinear or near-constant features
+RIDGE_ALPHA = 1e-6
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+# Per-process cache: model path -> (file mtime, SiteModel)
+_loaded_models = {}
+
+class SiteModel:
+    """Linear regression learned incrementally from running sums, one chunk of observations at a time
+
+    Keeps n, X'X and X'y (with an intercept column), so every update is exact and the fit after
+    any number of updates equals a ridge least-squares fit over all rows seen so far.
+    """
+
+    def __init__(self, features, target, alpha=RIDGE_ALPHA):
+        self.features = list(features)
+        self.target = target
+        self.alpha = alpha
+        size = len(self.features) + 1
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.samples_seen = 0
+        self.updated_at = None
+        self._coefficients = None
+
+    def _matrix(self, data):
+        if isinstance(data, np.ndarray):
+            matrix = np.asarray(data, dtype=float)
+            if matrix.ndim == 1:
+                matrix = matrix.reshape(1, -1)
+            if matrix.shape[1] != len(self.features):
+                raise ValueError(f"Expected {len(self.features)} feature columns, got {matrix.shape[1]}")
+            return matrix
+        frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(list(data))
+        missing = [column for column in self.features if column not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+        return frame[self.features].to_numpy(dtype=float)
+
+    def partial_fit(self, data):
+        """Update the model with new observations (rows with missing values are skipped)"""
+        frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(list(data))
+        if self.target not in frame.columns:
+            raise ValueError(f"Missing target column: {self.target}")
+        frame = frame.dropna(subset=self.features + [self.target])
+
+        for start in range(0, len(frame), UPDATE_CHUNK_ROWS):
+            chunk = frame.iloc[start:start + UPDATE_CHUNK_ROWS]
+            X = np.hstack([np.ones((len(chunk), 1)), self._matrix(chunk)])
+            y = chunk[self.target].to_numpy(dtype=float)
+            self.xtx += X.T @ X
+            self.xty += X.T @ y
+            self.samples_seen += len(chunk)
+
+        self._coefficients = None
+        self.updated_at = datetime.now().isoformat()
+        return len(frame)
+
+    @property
+    def coefficients(self):
+        """Intercept followed by one coefficient per feature, solved from the running sums"""
+        if self._coefficients is None:
+            n = self.samples_seen
+            mean = self.xtx[0, 1:] / n
+            variance = np.maximum(np.diag(self.xtx)[1:] / n - mean ** 2, 0.0)
+            # Ridge penalty on standardized coefficients (intercept unpenalized), so the fit
+            # does not depend on feature units
+            penalty = np.diag(np.concatenate([[0.0], self.alpha * n * variance]))
+            self._coefficients = np.linalg.lstsq(self.xtx + penalty, self.xty, rcond=None)[0]
+        return self._coefficients
+
+    def predict(self, data):
+        """Predict the target for a batch of feature rows (records, DataFrame or 2-D array)"""
+        if not self.samples_seen:
+            raise ValueError("Model has not been trained yet")
+        coefficients = self.coefficients
+        return coefficients[0] + self._matrix(data) @ coefficients[1:]
+
+class ModelStore:
+    """Directory of serialized SiteModels, one file per site and model type"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _model_path(self, site_id, model_type):
+        for name in (str(site_id), model_type):
+            if not _SAFE_NAME.match(name) or '__' in name:
+                raise ValueError(f"Invalid model name component: {name!r}")
+        return os.path.join(self.path, f"{site_id}__{model_type}.joblib")
+
+    @contextmanager
+    def _locked(self, site_id, model_type):
+        """Exclusive per-model lock, held across processes for a whole read-update-write"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._model_path(site_id, model_type) + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def load(self, site_id, model_type):
+        """Return the stored model, reading it from disk only when the file has changed"""
+        path = self._model_path(site_id, model_type)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = _loaded_models.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, joblib.load(path))
+            _loaded_models[path] = cached
+        return cached[1]
+
+    def save(self, site_id, model_type, model):
+        os.makedirs(self.path, exist_ok=True)
+        path = self._model_path(site_id, model_type)
+        temp_path = path + '.tmp'
+        joblib.dump(model, temp_path)
+        os.replace(temp_path, path)
+        _loaded_models[path] = (os.stat(path).st_mtime_ns, model)
+
+    def update(self, site_id, model_type, data, features=None, target=None):
+        """Fold new monitoring data into a site's model, creating it on first use"""
+        # Concurrent updates (separate analysis runs) would otherwise each add their batch to the
+        # same stored sums and the last save would drop the other's
+        with self._locked(site_id, model_type):
+            model = self.load(site_id, model_type)
+            if model is None:
+                defaults = MODEL_TYPES.get(model_type, {})
+                features = features or defaults.get('features')
+                target = target or defaults.get('target')
+                if not features or not target:
+                    raise ValueError(f"Unknown model type {model_type!r}; pass features and target explicitly")
+                model = SiteModel(features, target)
+            elif (features and list(features) != model.features) or (target and target != model.target):
+                raise ValueError(f"Model {site_id}/{model_type} was created with features {model.features} "
+                                 f"and target {model.target!r}")
+            try:
+                used = model.partial_fit(data)
+            except Exception:
+                # The cached copy may hold part of the batch; reload from disk next time
+                _loaded_models.pop(self._model_path(site_id, model_type), None)
+                raise
+            self.save(site_id, model_type, model)
+        return used
+
+    def predict(self, site_id, model_type, data):
+        model = self.load(site_id, model_type)
+        if model is None:
+            raise ValueError(f"No model stored for {site_id}/{model_type}")
+        return model.predict(data)
+
+    def list_models(self):
+        if not os.path.isdir(self.path):
+            return []
+        models = []
+        for filename in sorted(os.listdir(self.path)):
+            if filename.endswith('.joblib') and '__' in filename:
+                site_id, model_type = filename[:-len('.joblib')].split('__', 1)
+                model = self.load(site_id, model_type)
+                models.append({
+                    'site_id': site_id,
+                    'model_type': model_type,
+                    'features': model.features,
+                    'target': model.target,
+                    'samples_seen': model.samples_seen,
+                    'updated_at': model.updated_at
+                })
+        return models
+
+def _read_table(path):
+    if path == '-':
+        return pd.read_json(sys.stdin, lines=True)
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    return pd.read_json(path, lines=path.endswith('.jsonl'))
+
+def serve(store):
+    """Answer JSON-lines requests on stdin so models stay loaded between predictions
+
+    Models are reloaded only when their file changes, so updates from other processes are picked up.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        started = time.perf_counter()
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'predict':
+                rows = request['rows']
+                if rows and not isinstance(rows[0], dict):
+                    # Rows given as feature arrays, in the model's feature order
+                    rows = np.asarray(rows, dtype=float)
+                predictions = store.predict(request['site_id'], request['model_type'], rows)
+                response = {'predictions': predictions.tolist()}
+            elif op == 'update':
+                used = store.update(request['site_id'], request['model_type'], request['records'],
+                                    request.get('features'), request.get('target'))
+                response = {'used': used}
+            elif op == 'info':
+                response = {'models': store.list_models()}
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+            response['ok'] = True
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        response['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Incrementally trained site rainfall-runoff and pollutant-load models")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help="Train a site model on new monitoring data")
+    predict_parser = subparsers.add_parser('predict', help="Predict for a file of feature rows (JSON lines out)")
+    for sub in (update_parser, predict_parser):
+        sub.add_argument('store')
+        sub.add_argument('site_id')
+        sub.add_argument('model_type')
+        sub.add_argument('data', help="CSV, JSON or JSON-lines file, or - for JSON lines on stdin")
+    update_parser.add_argument('--features', help="Comma-separated feature columns for a new model")
+    update_parser.add_argument('--target', help="Target column for a new model")
+
+    info_parser = subparsers.add_parser('info', help="List stored models")
+    info_parser.add_argument('store')
+
+    serve_parser = subparsers.add_parser('serve', help="Answer JSON-lines predict/update/info requests on stdin")
+    serve_parser.add_argument('store')
+
+    args = parser.parse_args()
+    store = ModelStore(args.store)
+
+    if args.command == 'update':
+        features = args.features.split(',') if args.features else None
+        used = store.update(args.site_id, args.model_type, _read_table(args.data), features, args.target)
+        model = store.load(args.site_id, args.model_type)
+        print(f"Updated {args.site_id}/{args.model_type} with {used} rows ({model.samples_seen} seen in total)")
+    elif args.command == 'predict':
+        for value in store.predict(args.site_id, args.model_type, _read_table(args.data)).tolist():
+            sys.stdout.write(json.dumps({'prediction': value}) + '\n')
+    elif args.command == 'info':
+        for entry in store.list_models():
+            print(json.dumps(entry))
+    elif args.command == 'serve':
+        serve(store)
+
+if __name__ == "__main__":
+    # Run through the importable module so pickled models reference runoff_models.SiteModel,
+    # not __main__.SiteModel
+    import runoff_models
+    runoff_models.main()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Ranked retrieval index over the document library and recommendations
+BM25 scoring over hashed term counts, persisted as memory-mapped sparse segments
+
+Records use the same searchable fields as storage.ts globalSearch / searchRecommendations:
+    {"type": "document", "id": 12, "originalName": "...", "content": "...", "description": "..."}
+    {"type": "recommendation", "id": 5, "title": "...", "content": "...", "citation": "..."}
+
+Usage:
+    python search_index.py add index_dir records.jsonl      # incremental; creates the index if needed
+    python search_index.py remove index_dir document:12 recommendation:5
+    python search_index.py query index_dir "culvert inlet erosion" -k 10 --type document
+    python search_index.py compact index_dir
+    python search_index.py serve index_dir                  # JSON-lines requests on stdin, responses on stdout
+"""
+
+import argparse
+import fcntl
+import heapq
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.sparse import coo_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+
+SEARCH_FIELDS = {
+    'document': ['originalName', 'content', 'description'],
+    'recommendation': ['title', 'content', 'citation'],
+}
+
+N_FEATURES = 2 ** 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_SEGMENTS = 8
+
+def record_key(record):
+    """Index key for a storage record, e.g. 'document:12'"""
+    return f"{record['type']}:{record['id']}"
+
+def record_text(record):
+    """Concatenate the fields storage.ts searches for this record type"""
+    fields = SEARCH_FIELDS.get(record['type'])
+    if fields is None:
+        raise ValueError(f"Unsupported record type: {record['type']!r}")
+    return '\n'.join(str(record[field]) for field in fields if record.get(field))
+
+class Segment:
+    """An immutable batch of documents stored term-major, memory-mapped on load
+
+    Only terms that occur in the segment are stored: terms.npy holds their sorted hashed ids and
+    indptr.npy the start of each term's postings, so a segment's size follows its content rather
+    than N_FEATURES.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.terms = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+        self.indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+        self.data = np.load(os.path.join(path, 'data.npy'), mmap_mode='r')
+        self.doc_len = np.load(os.path.join(path, 'doc_len.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'keys.json'), 'r') as f:
+            self.keys = json.load(f)
+        self.live = np.ones(len(self.keys), dtype=bool)
+        self._types = None
+
+    @property
+    def types(self):
+        """Record type of each row, built on first use by a type-filtered query"""
+        if self._types is None:
+            self._types = np.array([key.split(':', 1)[0] for key in self.keys])
+        return self._types
+
+    @staticmethod
+    def write(path, keys, counts):
+        """Write a doc x term count matrix as a new segment directory"""
+        postings = counts.tocsc()
+        postings.sort_indices()
+        temp_path = path + '.tmp'
+        # Clear leftovers from an add that crashed before its manifest was saved
+        for stale in (temp_path, path):
+            shutil.rmtree(stale, ignore_errors=True)
+        os.makedirs(temp_path)
+        present = np.flatnonzero(np.diff(postings.indptr))
+        np.save(os.path.join(temp_path, 'terms.npy'), present.astype(np.int32))
+        np.save(os.path.join(temp_path, 'indptr.npy'), np.append(postings.indptr[present], postings.nnz).astype(np.int64))
+        np.save(os.path.join(temp_path, 'indices.npy'), postings.indices.astype(np.int32))
+        np.save(os.path.join(temp_path, 'data.npy'), postings.data.astype(np.float32))
+        np.save(os.path.join(temp_path, 'doc_len.npy'), np.asarray(counts.sum(axis=1), dtype=np.float32).ravel())
+        with open(os.path.join(temp_path, 'keys.json'), 'w') as f:
+            json.dump(keys, f)
+        os.replace(temp_path, path)
+
+    def postings(self, term):
+        """(rows, counts) for a hashed term id; empty arrays when the term does not occur"""
+        position = int(np.searchsorted(self.terms, term))
+        if position == len(self.terms) or self.terms[position] != term:
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_counts(self):
+        """Rebuild the doc x term count matrix (used when merging segments)"""
+        columns = np.repeat(np.asarray(self.terms), np.diff(self.indptr))
+        return coo_matrix((self.data, (self.indices, columns)), shape=(len(self.keys), N_FEATURES)).tocsr()
+
+class SearchIndex:
+    """Incremental BM25 index; each add() writes a new segment instead of rebuilding
+
+    Several processes may open the same index (a serve process and CLI adds, say). Writers hold an
+    exclusive lock on index.lock and re-read the manifest under it; readers pick up other writers'
+    changes whenever the manifest file is replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.vectorizer = HashingVectorizer(n_features=N_FEATURES, alternate_sign=False, norm=None,
+                                            stop_words='english', dtype=np.float32)
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.segments = []
+        self.locations = {}
+        self._manifest_version = None
+        with self._locked(fcntl.LOCK_SH):
+            self._load()
+
+    def __len__(self):
+        return len(self.locations)
+
+    @contextmanager
+    def _locked(self, mode):
+        """Hold index.lock: LOCK_EX for add/remove/compact, LOCK_SH while loading the manifest"""
+        with open(os.path.join(self.path, 'index.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            yield
+
+    def _current_version(self):
+        # The manifest is replaced atomically, so a new inode or mtime means another writer saved it
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        """(Re)read the manifest, reusing already-open segments"""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'n_features': N_FEATURES, 'next_segment': 0, 'segments': [], 'deleted': {}}
+        if self.manifest['n_features'] != N_FEATURES:
+            raise ValueError(f"Index was built with {self.manifest['n_features']} hashed features, expected {N_FEATURES}")
+
+        open_segments = {segment.name: segment for segment in self.segments}
+        self.segments = [open_segments.get(name) or Segment(os.path.join(self.path, name))
+                         for name in self.manifest['segments']]
+        self.locations = {}
+        for segment in self.segments:
+            segment.live[:] = True
+            for row in self.manifest['deleted'].get(segment.name, []):
+                segment.live[row] = False
+            for row, key in enumerate(segment.keys):
+                if segment.live[row]:
+                    self.locations[key] = (segment, row)
+        self._manifest_version = self._current_version()
+
+    def refresh(self):
+        """Reload if another process has changed the index since it was last read"""
+        if self._current_version() != self._manifest_version:
+            with self._locked(fcntl.LOCK_SH):
+                self._load()
+
+    def _save_manifest(self):
+        self.manifest['segments'] = [segment.name for segment in self.segments]
+        self.manifest['deleted'] = {
+            segment.name: np.flatnonzero(~segment.live).tolist()
+            for segment in self.segments if not segment.live.all()
+        }
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        self._manifest_version = self._current_version()
+
+    def _new_segment_path(self):
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        self.manifest['next_segment'] += 1
+        return os.path.join(self.path, name)
+
+    def _tombstone(self, key):
+        location = self.locations.pop(key, None)
+        if location is not None:
+            segment, row = location
+            segment.live[row] = False
+        return location is not None
+
+    def add(self, records):
+        """Index new or updated records; an existing key is replaced"""
+        records = list(records)
+        if not records:
+            return 0
+        with self._locked(fcntl.LOCK_EX):
+            self._load()
+            return self._add(records)
+
+    def _add(self, records):
+        keys = [record_key(record) for record in records]
+        # Within one batch the last record for a key wins
+        latest = {key: i for i, key in enumerate(keys)}
+        keep = sorted(latest.values())
+        keys = [keys[i] for i in keep]
+        counts = self.vectorizer.transform(record_text(records[i]) for i in keep)
+
+        path = self._new_segment_path()
+        Segment.write(path, keys, counts)
+        for key in keys:
+            self._tombstone(key)
+        segment = Segment(path)
+        self.segments.append(segment)
+        for row, key in enumerate(keys):
+            self.locations[key] = (segment, row)
+
+        if len(self.segments) > MAX_SEGMENTS:
+            # Merge the smaller half of the segments so steady uploads rewrite the
+            # small recent segments rather than the bulk of the index
+            by_size = sorted(self.segments, key=lambda seg: len(seg.keys))
+            self._merge(by_size[:len(by_size) // 2 + 1])
+        else:
+            self._save_manifest()
+        return len(keys)
+
+    def remove(self, keys):
+        """Drop records by key; returns how many were present"""
+        with self._locked(fcntl.LOCK_EX):
+            self._load()
+            removed = sum(1 for key in keys if self._tombstone(key))
+            if removed:
+                self._save_manifest()
+        return removed
+
+    def compact(self):
+        """Merge all segments into one, dropping deleted rows"""
+        with self._locked(fcntl.LOCK_EX):
+            self._load()
+            if len(self.segments) > 1 or any(not segment.live.all() for segment in self.segments):
+                self._merge(list(self.segments))
+
+    def _merge(self, merging):
+        keys, blocks = [], []
+        for segment in merging:
+            live_rows = np.flatnonzero(segment.live)
+            if len(live_rows):
+                keys.extend(segment.keys[row] for row in live_rows)
+                blocks.append(segment.row_counts()[live_rows])
+
+        position = self.segments.index(merging[0])
+        self.segments = [segment for segment in self.segments if segment not in merging]
+        if blocks:
+            path = self._new_segment_path()
+            Segment.write(path, keys, vstack(blocks).tocsr())
+            merged = Segment(path)
+            self.segments.insert(position, merged)
+            for row, key in enumerate(keys):
+                self.locations[key] = (merged, row)
+        self._save_manifest()
+        for segment in merging:
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def query(self, text, k=10, record_type=None):
+        """Return the top-k (key, score) pairs for a free-text query, best first"""
+        self.refresh()
+        terms = self.vectorizer.transform([text])
+        if terms.nnz == 0 or not self.locations:
+            return []
+
+        # Collection statistics over live documents only, so replaced or removed records
+        # awaiting compaction do not inflate document frequencies
+        n_docs = len(self.locations)
+        total_len = sum(float(segment.doc_len[segment.live].sum()) for segment in self.segments)
+        avg_len = total_len / n_docs if n_docs else 1.0
+        term_ids = terms.indices.tolist()
+        query_tf = terms.data.tolist()
+        postings = [[segment.postings(term) for term in term_ids] for segment in self.segments]
+        idf = []
+        for t in range(len(term_ids)):
+            df = sum(int(segment.live[segment_postings[t][0]].sum())
+                     for segment, segment_postings in zip(self.segments, postings))
+            idf.append(math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+
+        candidates = []
+        for segment, segment_postings in zip(self.segments, postings):
+            rows_parts, weight_parts = [], []
+            for (rows, tf), term_idf, qtf in zip(segment_postings, idf, query_tf):
+                if len(rows) == 0:
+                    continue
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.doc_len[rows] / avg_len)
+                rows_parts.append(rows)
+                weight_parts.append(qtf * term_idf * tf * (BM25_K1 + 1) / (tf + length_norm))
+            if not rows_parts:
+                continue
+
+            scores = np.bincount(np.concatenate(rows_parts), weights=np.concatenate(weight_parts),
+                                 minlength=len(segment.keys))
+            scores[~segment.live] = 0.0
+            if record_type:
+                scores[segment.types != record_type] = 0.0
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            candidates.extend((float(scores[row]), segment.keys[row]) for row in hits)
+
+        return [(key, score) for score, key in heapq.nlargest(k, candidates)]
+
+def _read_records(path):
+    source = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+def serve(index):
+    """Answer JSON-lines requests on stdin so the index stays loaded between queries"""
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        started = time.perf_counter()
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'query':
+                hits = index.query(request['q'], request.get('k', 10), request.get('type'))
+                response = {'results': [{'key': key, 'score': round(score, 4)} for key, score in hits]}
+            elif op == 'add':
+                response = {'added': index.add(request['records'])}
+            elif op == 'remove':
+                response = {'removed': index.remove(request['keys'])}
+            elif op == 'compact':
+                index.compact()
+                response = {'segments': len(index.segments)}
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+            response['ok'] = True
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        response['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="BM25 search index over documents and recommendations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="Index records from a JSON-lines file (or - for stdin)")
+    add_parser.add_argument('index_dir')
+    add_parser.add_argument('records')
+
+    remove_parser = subparsers.add_parser('remove', help="Remove records by key, e.g. document:12")
+    remove_parser.add_argument('index_dir')
+    remove_parser.add_argument('keys', nargs='+')
+
+    query_parser = subparsers.add_parser('query', help="Print the top-k matches for a query")
+    query_parser.add_argument('index_dir')
+    query_parser.add_argument('text')
+    query_parser.add_argument('-k', type=int, default=10)
+    query_parser.add_argument('--type', choices=sorted(SEARCH_FIELDS))
+
+    compact_parser = subparsers.add_parser('compact', help="Merge segments and drop deleted records")
+    compact_parser.add_argument('index_dir')
+
+    serve_parser = subparsers.add_parser('serve', help="Answer JSON-lines requests on stdin")
+    serve_parser.add_argument('index_dir')
+
+    args = parser.parse_args()
+    index = SearchIndex(args.index_dir)
+
+    if args.command == 'add':
+        added = 0
+        batch = []
+        for record in _read_records(args.records):
+            batch.append(record)
+            if len(batch) >= 50000:
+                added += index.add(batch)
+                batch = []
+        added += index.add(batch)
+        print(f"Indexed {added} records ({len(index)} total, {len(index.segments)} segments)")
+    elif args.command == 'remove':
+        print(f"Removed {index.remove(args.keys)} records")
+    elif args.command == 'query':
+        for key, score in index.query(args.text, args.k, args.type):
+            print(f"{score:8.3f}  {key}")
+    elif args.command == 'compact':
+        index.compact()
+        print(f"Compacted to {len(index.segments)} segment(s), {len(index)} records")
+    elif args.command == 'serve':
+        serve(index)
+
+if __name__ == "__main__":
+    main()
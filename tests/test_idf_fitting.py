@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from idf_fitting import MIN_YEAR_COVERAGE, annual_maxima, fit_idf_curves
+
+def _hourly_record(start, end, seed=0):
+    index = pd.date_range(start, end, freq='h')
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'G1': rng.gamma(0.05, 0.2, len(index))}, index=index)
+
+def test_partial_first_and_last_years_are_dropped():
+    rainfall = _hourly_record('2000-12-01', '2005-06-30 23:00')
+    maxima = annual_maxima(rainfall, [60, 120], 60)
+
+    for yearly in maxima.values():
+        assert np.isnan(yearly.loc[2000, 'G1'])
+        assert np.isnan(yearly.loc[2005, 'G1'])
+        assert yearly.loc[2001:2004, 'G1'].notna().all()
+
+def test_gaps_below_coverage_threshold_drop_the_year():
+    rainfall = _hourly_record('2000-01-01', '2002-12-31 23:00')
+    gap_days = int(366 * (1 - MIN_YEAR_COVERAGE)) + 5
+    rainfall = rainfall.drop(rainfall.loc['2001-03-01':pd.Timestamp('2001-03-01') + pd.Timedelta(days=gap_days)].index)
+
+    yearly = annual_maxima(rainfall, [60], 60)[60]
+    assert np.isnan(yearly.loc[2001, 'G1'])
+    assert yearly.loc[[2000, 2002], 'G1'].notna().all()
+
+def test_fit_idf_curves_recovers_known_parameters():
+    durations = np.array([5, 10, 15, 30, 60, 120, 360, 1440], dtype=float)
+    intensities = (40.0 / (durations + 12.0) ** 0.8)[:, None]
+
+    a, b, c = fit_idf_curves(durations, intensities)
+    assert abs(b[0] - 12.0) < 1e-9
+    assert abs(c[0] - 0.8) < 1e-6
+    assert abs(a[0] - 40.0) < 1e-4
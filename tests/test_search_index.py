@@ -0,0 +1,94 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from search_index import MAX_SEGMENTS, SearchIndex
+
+WORDS = ("culvert inlet erosion sediment basin bioretention swale runoff detention pond filter "
+         "wetland permit outfall scour riprap").split()
+QUERIES = ["culvert scour", "wetland permit outfall", "sediment basin filter"]
+
+def _records(n, seed=0, start=0):
+    rng = random.Random(seed)
+    return [{'type': rng.choice(['document', 'recommendation']), 'id': start + i, 'originalName': f"file_{i}",
+             'title': f"rec_{i}", 'content': ' '.join(rng.choices(WORDS, k=rng.randint(5, 40)))}
+            for i in range(n)]
+
+def _results(index, k=50):
+    return {query: [(key, round(score, 5)) for key, score in index.query(query, k)] for query in QUERIES}
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def test_replaced_records_do_not_change_scores(tmp_path):
+    records = _records(300)
+    index = SearchIndex(str(tmp_path / 'index'))
+    index.add(records)
+    before = _results(index)
+
+    for _ in range(5):
+        index.add([records[5], records[17]])
+    assert _results(index) == before
+    assert len(index) == 300
+
+def test_removed_records_score_like_a_fresh_index(tmp_path):
+    records = _records(300)
+    removed = {f"{record['type']}:{record['id']}" for record in records[:40]}
+    index = SearchIndex(str(tmp_path / 'index'))
+    index.add(records)
+    assert index.remove(sorted(removed)) == 40
+
+    fresh = SearchIndex(str(tmp_path / 'fresh'))
+    fresh.add(records[40:])
+    results = _results(index)
+    assert results == _results(fresh)
+    assert not removed & {key for hits in results.values() for key, _ in hits}
+
+def test_merges_and_compaction_keep_rankings(tmp_path):
+    records = _records(600)
+    single = SearchIndex(str(tmp_path / 'single'))
+    single.add(records)
+    expected = _results(single)
+
+    index = SearchIndex(str(tmp_path / 'index'))
+    for start in range(0, len(records), 30):
+        index.add(records[start:start + 30])
+    assert len(index.segments) <= MAX_SEGMENTS
+    assert _results(index) == expected
+
+    index.compact()
+    assert len(index.segments) == 1
+    assert _results(index) == expected
+    assert _results(SearchIndex(str(tmp_path / 'index'))) == expected
+
+def test_small_segments_stay_small(tmp_path):
+    index = SearchIndex(str(tmp_path / 'index'))
+    index.add(_records(1))
+    # Only occurring terms are stored, not an indptr over every hashed feature
+    assert _directory_bytes(str(tmp_path / 'index')) < 64 * 1024
+
+def test_second_instance_sees_other_writers(tmp_path):
+    path = str(tmp_path / 'index')
+    server = SearchIndex(path)
+    server.add(_records(50))
+    other = SearchIndex(path)
+    other.add(_records(50, seed=1, start=1000))
+
+    # The first instance must not reuse the other writer's segment names
+    server.add(_records(50, seed=2, start=2000))
+    assert len(SearchIndex(path)) == 150
+    assert any(int(key.split(':')[1]) >= 1000 for hits in _results(server).values() for key, _ in hits)
+    assert len(server) == 150
+
+def _add_batch(args):
+    path, seed = args
+    return SearchIndex(path).add(_records(40, seed=seed, start=seed * 1000))
+
+def test_concurrent_writers_do_not_lose_records(tmp_path):
+    path = str(tmp_path / 'index')
+    SearchIndex(path)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        assert sum(executor.map(_add_batch, [(path, seed) for seed in range(1, 21)])) == 800
+    index = SearchIndex(path)
+    assert len(index) == 800
+    assert len(index.segments) <= MAX_SEGMENTS